@@ -33,6 +33,37 @@ class Tools:
         return tools# For cross-check, we don't need any tools as we'll use direct LLM calls
 
 
+    @staticmethod
+    def parse_plan_steps(log_path: str) -> List[Dict]:
+        """Parse the first planner_agent plan in a log file into a list of numbered steps"""
+        with open(log_path, 'r') as f:
+            log_data = json.load(f)
+        
+        steps = []
+        if isinstance(log_data, dict) and "user_proxy_agent" in log_data:
+            messages = log_data["user_proxy_agent"]
+            
+            # Find the first planner_agent message with a plan
+            for msg in messages:
+                if msg.get("name") == "planner_agent" and isinstance(msg.get("content"), dict):
+                    content = msg["content"]
+                    if "plan" in content:
+                        # Extract steps from the plan
+                        plan_lines = content["plan"].split("\n")
+                        for line in plan_lines:
+                            if line.strip() and line[0].isdigit():
+                                # Extract step number and description
+                                parts = line.split(".", 1)
+                                if len(parts) == 2:
+                                    step_num = parts[0].strip()
+                                    description = parts[1].strip()
+                                    steps.append({
+                                        "step_number": int(step_num),
+                                        "description": description
+                                    })
+                        break  # We only need the first plan
+        return steps
+
     @tool
     def extract_steps_from_log(
         log_path: Annotated[str, "Path to the log file to analyze"],
@@ -40,41 +71,11 @@ class Tools:
         """Extract steps from a log file. The log file should be a JSON file containing the test execution steps.
         This tool will parse the log file and return a structured list of steps with their descriptions."""
         try:
-            # Read the log file
-            with open(log_path, 'r') as f:
-                log_content = f.read()
-            
-            # Parse the log content
             try:
-                log_data = json.loads(log_content)
+                steps = Tools.parse_plan_steps(log_path)
             except json.JSONDecodeError:
                 return f"Error: Invalid JSON format in log file: {log_path}"
             
-            # Extract steps
-            steps = []
-            if isinstance(log_data, dict) and "user_proxy_agent" in log_data:
-                messages = log_data["user_proxy_agent"]
-                
-                # Find the first planner_agent message with a plan
-                for msg in messages:
-                    if msg.get("name") == "planner_agent" and isinstance(msg.get("content"), dict):
-                        content = msg["content"]
-                        if "plan" in content:
-                            # Extract steps from the plan
-                            plan_lines = content["plan"].split("\n")
-                            for line in plan_lines:
-                                if line.strip() and line[0].isdigit():
-                                    # Extract step number and description
-                                    parts = line.split(".", 1)
-                                    if len(parts) == 2:
-                                        step_num = parts[0].strip()
-                                        description = parts[1].strip()
-                                        steps.append({
-                                            "step_number": int(step_num),
-                                            "description": description
-                                        })
-                            break  # We only need the first plan
-            
             if not steps:
                 return "No steps found in the log file."
             
@@ -0,0 +1,352 @@
+from pathlib import Path
+from collections import Counter
+import bisect
+import logging
+import json
+import re
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 5
+INDEX_FILE = "history_index.json"
+
+# Only timestamped run IDs can be indexed, since their string order is chronological
+RUN_ID_PATTERN = r"run_\d{8}_\d{6}"
+FINAL_ANALYSIS_PATTERN = re.compile(rf"^final_analysis_(.+)_({RUN_ID_PATTERN})\.json$")
+VIDEO_ANALYSIS_PATTERN = re.compile(rf"^video_analysis_(.+)_({RUN_ID_PATTERN})\.json$")
+# Triage verdicts whose final analysis did not cross-check every screenshot
+TRIAGE_ONLY_VERDICTS = ("clean", "suspicious_steps")
+SCREENSHOT_PATTERN = re.compile(r"(\w+)_(start|end)_\d+\.png$")
+# Section headings of the verification results, with optional numbering and markdown
+SECTION_PATTERN = re.compile(r"^(?:\d+\.\s*)?(confirmed conclusions|incorrect conclusions|final summary)\b", re.IGNORECASE)
+BULLET_PATTERN = re.compile(r"^(?:[-*•]|\d+[.)])\s+")
+
+def is_indexable_run(run_id: str) -> bool:
+    """Whether a run ID can be placed in the history"""
+    return re.fullmatch(RUN_ID_PATTERN, run_id) is not None
+
+def strip_markdown(line: str) -> str:
+    """Remove heading and emphasis markers around a line"""
+    return line.strip().strip("#*_ ").replace("**", "").strip()
+
+def strip_bullet(line: str) -> str:
+    """Remove a leading "-", "*", "•" or "1." bullet"""
+    return BULLET_PATTERN.sub("", line.strip(), count=1)
+
+def normalize_finding(text: str) -> str:
+    """Reduce a finding to a stable key so the same issue matches across runs.
+
+    Findings are written as "- Title: details" or "1. Title: details"; only
+    the title is kept, lowercased and stripped of punctuation and markdown.
+    """
+    text = strip_bullet(text.replace("**", ""))
+    title, sep, _ = text.partition(":")
+    if sep and len(title) <= 80:
+        text = title
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+def parse_findings(verification_results: str) -> dict:
+    """Extract the confirmed findings from a verification results text.
+
+    Returns a mapping of normalized finding key to the original bullet text.
+    """
+    findings = {}
+    in_confirmed = False
+    finding_indent = None
+    for raw_line in verification_results.split('\n'):
+        line = raw_line.strip()
+        section = SECTION_PATTERN.match(strip_markdown(line))
+        if section:
+            in_confirmed = section.group(1).lower() == "confirmed conclusions"
+            finding_indent = None
+            continue
+        if in_confirmed and BULLET_PATTERN.match(line):
+            # Indented sub-bullets hold evidence for the finding above them
+            indent = len(raw_line) - len(raw_line.lstrip())
+            if finding_indent is None:
+                finding_indent = indent
+            if indent > finding_indent:
+                continue
+            key = normalize_finding(line)
+            if key and not key.startswith("none"):
+                findings.setdefault(key, strip_bullet(line))
+    return findings
+
+def count_screenshot_actions(screenshot_analysis: list) -> dict:
+    """Count screenshots per action and phase, e.g. {"click_start": 4}"""
+    actions = Counter()
+    for analysis in screenshot_analysis:
+        # Paths may have been recorded with Windows separators
+        name = re.split(r"[\\/]", analysis.get("screenshot", ""))[-1]
+        match = SCREENSHOT_PATTERN.match(name)
+        if match:
+            actions["_".join(match.groups())] += 1
+    return dict(actions)
+
+def is_full_analysis(run: dict) -> bool:
+    """Whether a run has a final analysis that cross-checked every screenshot"""
+    return "final" in run and run["final"].get("triage_verdict") not in TRIAGE_ONLY_VERDICTS
+
+class AnalysisHistory:
+    """Indexed history of final and screenshot analyses per test name.
+
+    Each analysis file is parsed once when it is added; the index keeps the
+    parsed findings (and screenshot action counts) and the file's mtime and
+    size so unchanged files are never re-read. The diff of every run against
+    its previous `window` final analyses is computed when the run is added
+    and stored in the index. Adding a run parses only the new file and
+    recomputes only the diffs that depend on it, walking back no further
+    than the diff window. The index itself is a single JSON file that is
+    rewritten on save.
+    """
+    def __init__(self, log_dir: str = "analysis_logs", window: int = DEFAULT_WINDOW):
+        self.log_dir = Path(log_dir)
+        self.index_path = self.log_dir / INDEX_FILE
+        self.window = window
+        # Set when an existing index could not be loaded; sync() rebuilds it
+        self.rebuilt = False
+        self.index = self._load_index()
+
+    def _load_index(self) -> dict:
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+                self._validate_index(index)
+                if index.get("window") == self.window:
+                    return index
+                logger.info("History window changed, rebuilding stored diffs")
+                index["window"] = self.window
+                for test in index["tests"].values():
+                    for position in range(len(test["order"])):
+                        self._update_diff(test, position)
+                return index
+            except Exception as e:
+                logger.error(f"Error loading history index, rebuilding: {str(e)}")
+                self.rebuilt = True
+        return {"window": self.window, "tests": {}}
+
+    @staticmethod
+    def _validate_index(index):
+        if not isinstance(index, dict) or not isinstance(index.get("tests"), dict):
+            raise ValueError("History index has no 'tests' mapping")
+        for test_name, test in index["tests"].items():
+            if (not isinstance(test, dict) or not isinstance(test.get("order"), list)
+                    or not isinstance(test.get("runs"), dict) or set(test["order"]) != set(test["runs"])):
+                raise ValueError(f"Malformed history entry for test: {test_name}")
+
+    def save(self):
+        """Write the index back to the analysis_logs folder"""
+        try:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.index_path, 'w') as f:
+                json.dump(self.index, f, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving history index: {str(e)}")
+
+    def sync(self) -> int:
+        """Add any analysis files that are new or changed since they were indexed"""
+        added = 0
+        if not self.log_dir.exists():
+            return added
+        # An unreadable index is replaced even if no analysis files remain
+        replace_index = self.rebuilt
+        self.rebuilt = False
+        for path in sorted(self.log_dir.glob("*_analysis_*.json")):
+            if FINAL_ANALYSIS_PATTERN.match(path.name):
+                added += self.add_final_analysis(path, save=False)
+            elif VIDEO_ANALYSIS_PATTERN.match(path.name):
+                added += self.add_screenshot_analysis(path, save=False)
+        if added or replace_index:
+            self.save()
+        return added
+
+    def add_final_analysis(self, path, save: bool = True) -> bool:
+        """Index a final_analysis_{test}_{run}.json file; returns False if already up to date"""
+        path = Path(path)
+        match = FINAL_ANALYSIS_PATTERN.match(path.name)
+        if not match:
+            raise ValueError(f"Not a final analysis file: {path.name}")
+        test_name, run_id = match.groups()
+        if self._is_current(test_name, run_id, "final", path):
+            return False
+
+        with open(path, 'r') as f:
+            analysis_data = json.load(f)
+        record = self._file_record(path)
+        record["timestamp"] = analysis_data.get("timestamp")
+        record["findings"] = parse_findings(analysis_data.get("verification_results", ""))
+        if "triage" in analysis_data:
+            record["triage_verdict"] = analysis_data["triage"].get("verdict")
+        self._add(test_name, run_id, "final", record)
+        if save:
+            self.save()
+        return True
+
+    def add_screenshot_analysis(self, path, save: bool = True) -> bool:
+        """Index a video_analysis_{test}_{run}.json file; returns False if already up to date"""
+        path = Path(path)
+        match = VIDEO_ANALYSIS_PATTERN.match(path.name)
+        if not match:
+            raise ValueError(f"Not a screenshot analysis file: {path.name}")
+        test_name, run_id = match.groups()
+        if self._is_current(test_name, run_id, "screenshots", path):
+            return False
+
+        with open(path, 'r') as f:
+            screenshot_analysis = json.load(f)
+        record = self._file_record(path)
+        record["count"] = len(screenshot_analysis)
+        record["actions"] = count_screenshot_actions(screenshot_analysis)
+        self._add(test_name, run_id, "screenshots", record)
+        if save:
+            self.save()
+        return True
+
+    def runs(self, test_name: str) -> list:
+        """Get the indexed run IDs for a test, oldest first"""
+        return list(self.index["tests"].get(test_name, {}).get("order", []))
+
+    def diff(self, test_name: str, run_id: str = None, window: int = None) -> dict:
+        """Compare a run's findings with the previous `window` fully analysed runs of the same test.
+
+        Defaults to the latest run and the index window. Returns the new and
+        persistent findings, the findings of the most recent compared run
+        that are gone ("resolved"), and screenshot action changes against the
+        previous run with a screenshot analysis. Runs that triage verified
+        alone, or that only cross-checked flagged screenshots, are never used
+        as a baseline and never report findings as resolved.
+        """
+        test = self.index["tests"].get(test_name)
+        if not test or not test["order"]:
+            raise KeyError(f"No indexed runs for test: {test_name}")
+        run_id = run_id or test["order"][-1]
+        if run_id not in test["runs"]:
+            raise KeyError(f"Run not indexed for test {test_name}: {run_id}")
+
+        if window is None or window == self.window:
+            stored = test["runs"][run_id].get("diff")
+            if stored is not None:
+                return stored
+        return self._compute_diff(test, bisect.bisect_left(test["order"], run_id), window or self.window)
+
+    def _file_record(self, path: Path) -> dict:
+        stat = path.stat()
+        return {"source": path.name, "mtime": stat.st_mtime, "size": stat.st_size}
+
+    def _is_current(self, test_name: str, run_id: str, kind: str, path: Path) -> bool:
+        run = self.index["tests"].get(test_name, {}).get("runs", {}).get(run_id, {})
+        record = run.get(kind)
+        if not record:
+            return False
+        stat = path.stat()
+        return record["mtime"] == stat.st_mtime and record["size"] == stat.st_size
+
+    def _add(self, test_name: str, run_id: str, kind: str, record: dict):
+        test = self.index["tests"].setdefault(test_name, {"order": [], "runs": {}})
+        if run_id not in test["runs"]:
+            # Run IDs embed their start time, so string order is chronological
+            bisect.insort(test["order"], run_id)
+            test["runs"][run_id] = {}
+        test["runs"][run_id][kind] = record
+
+        position = bisect.bisect_left(test["order"], run_id)
+        self._update_diff(test, position)
+
+        # Later runs depend on this one while it is among their previous
+        # `window` full analyses, or is their previous screenshot analysis
+        finals_between = 0
+        screenshots_between = False
+        for later in range(position + 1, len(test["order"])):
+            if finals_between >= self.window and screenshots_between:
+                break
+            self._update_diff(test, later)
+            later_run = test["runs"][test["order"][later]]
+            finals_between += is_full_analysis(later_run)
+            screenshots_between = screenshots_between or "screenshots" in later_run
+
+    def _update_diff(self, test: dict, position: int):
+        run = test["runs"][test["order"][position]]
+        run["diff"] = self._compute_diff(test, position, self.window)
+
+    def _compute_diff(self, test: dict, position: int, window: int) -> dict:
+        run_id = test["order"][position]
+        run = test["runs"][run_id]
+
+        # Walk back only as far as the previous `window` full analyses and
+        # the previous screenshot analysis
+        previous_finals = []
+        previous_screenshots = None
+        for i in range(position - 1, -1, -1):
+            if len(previous_finals) >= window and previous_screenshots is not None:
+                break
+            earlier_id = test["order"][i]
+            earlier = test["runs"][earlier_id]
+            if is_full_analysis(earlier) and len(previous_finals) < window:
+                previous_finals.append(earlier_id)
+            if "screenshots" in earlier and previous_screenshots is None:
+                previous_screenshots = earlier_id
+
+        result = {"run_id": run_id, "compared_with": [], "new": {}, "resolved": {}, "persistent": {}}
+        final = run.get("final")
+        if final is not None:
+            result["compared_with"] = previous_finals
+            seen = {}
+            seen_count = Counter()
+            # Walk oldest to newest so the latest wording of each finding wins
+            for previous_run in reversed(previous_finals):
+                for key, text in test["runs"][previous_run]["final"]["findings"].items():
+                    seen[key] = text
+                    seen_count[key] += 1
+            current = final["findings"]
+            result["new"] = {k: v for k, v in current.items() if k not in seen}
+            if final.get("triage_verdict") in TRIAGE_ONLY_VERDICTS:
+                # A triage-only pass cannot show that a finding was fixed
+                result["triage_verdict"] = final["triage_verdict"]
+            elif previous_finals:
+                latest = test["runs"][previous_finals[0]]["final"]["findings"]
+                result["resolved"] = {k: v for k, v in latest.items() if k not in current}
+            result["persistent"] = {
+                k: {"text": v, "previous_occurrences": seen_count[k]}
+                for k, v in current.items() if k in seen
+            }
+
+        screenshots = run.get("screenshots")
+        if screenshots is not None and previous_screenshots is not None:
+            before = Counter(test["runs"][previous_screenshots]["screenshots"]["actions"])
+            after = Counter(screenshots["actions"])
+            result["screenshots"] = {
+                "compared_with": previous_screenshots,
+                "added": dict(after - before),
+                "removed": dict(before - after),
+            }
+        return result
+
+def format_history_diff(diff: dict) -> str:
+    """Human-readable summary of a history diff"""
+    lines = []
+    if diff.get("triage_verdict"):
+        lines.append(f"{diff['run_id']} was checked by triage only ({diff['triage_verdict']}); "
+                     "earlier findings are not reported as resolved")
+    if not diff["compared_with"]:
+        lines.append(f"No earlier full analyses to compare {diff['run_id']} with")
+        return "\n".join(lines)
+
+    lines.append(f"Changes in {diff['run_id']} compared with {len(diff['compared_with'])} previous run(s):")
+    for label, key in (("New", "new"), ("Resolved", "resolved"), ("Persistent", "persistent")):
+        lines.append(f"{label} findings ({len(diff[key])}):")
+        for value in diff[key].values():
+            if key == "persistent":
+                lines.append(f"  - {value['text']} (seen in {value['previous_occurrences']} previous run(s))")
+            else:
+                lines.append(f"  - {value}")
+
+    screenshots = diff.get("screenshots")
+    if screenshots and (screenshots["added"] or screenshots["removed"]):
+        lines.append(f"Screenshot changes since {screenshots['compared_with']}:")
+        for action, count in screenshots["added"].items():
+            lines.append(f"  + {count} x {action}")
+        for action, count in screenshots["removed"].items():
+            lines.append(f"  - {count} x {action}")
+    return "\n".join(lines)
@@ -1,10 +1,14 @@
 from agent_lc.agent import Agent
 from agent_lc.prompts import LOG_ANALYZER_PROMPT, VIDEO_ANALYZER_PROMPT
+from pipeline import Pipeline
+from triage import triage_run, format_triage_report
+from history import AnalysisHistory, format_history_diff, is_indexable_run
 from pathlib import Path
 import logging
 import time
 import json
 from datetime import datetime
+from concurrent.futures import Future
 from groq import Groq
 import os
 from dotenv import load_dotenv
@@ -59,15 +63,27 @@ def get_latest_analysis(test_name: str, run_id: str) -> list:
         print(f"Error loading existing analysis: {str(e)}")
         return []
 
-def save_analysis_to_log(analysis_data: list, test_name: str, run_id: str):
-    """Save video analysis results to a log file in the analysis_logs folder"""
+def open_history(log_dir: Path) -> AnalysisHistory:
+    """Open the analysis history, indexing existing files when it is new or unreadable"""
+    history = AnalysisHistory(log_dir)
+    if not history.index_path.exists() or history.rebuilt:
+        history.sync()
+    return history
+
+def save_analysis_to_log(analysis_data: list, test_name: str, run_id: str, partial: bool = False):
+    """Save video analysis results to a log file in the analysis_logs folder.
+
+    Partial analyses (only the screenshots flagged by triage) go to a separate
+    file so they are never loaded or indexed as a complete analysis.
+    """
     try:
         # Create logs directory
         log_dir = Path("analysis_logs")
         log_dir.mkdir(parents=True, exist_ok=True)
         
         # Create filename with test_id and run_id
-        log_file = log_dir / f"video_analysis_{test_name}_{run_id}.json"
+        prefix = "partial_video_analysis" if partial else "video_analysis"
+        log_file = log_dir / f"{prefix}_{test_name}_{run_id}.json"
         
         # Save the analysis
         with open(log_file, 'w') as f:
@@ -76,6 +92,15 @@ def save_analysis_to_log(analysis_data: list, test_name: str, run_id: str):
         print(f"\nAnalysis saved to: {log_file}")
     except Exception as e:
         logger.error(f"Error saving analysis to log: {str(e)}")
+        return
+
+    if partial or not is_indexable_run(run_id):
+        return
+    try:
+        # Index the new analysis alongside earlier runs of this test
+        open_history(log_dir).add_screenshot_analysis(log_file)
+    except Exception as e:
+        logger.error(f"Error updating analysis history: {str(e)}")
 
 def get_latest_log_file(test_name: str, run_id: str) -> str:
     """Get the most recent log file for a test run"""
@@ -97,7 +122,7 @@ def get_latest_log_file(test_name: str, run_id: str) -> str:
         logger.error(f"Error getting latest log file: {str(e)}")
         raise
 
-def save_final_analysis(test_name: str, run_id: str, verification_results: str):
+def save_final_analysis(test_name: str, run_id: str, verification_results: str, triage_report: dict = None):
     """Save the final analysis results to a log file"""
     try:
         # Create logs directory
@@ -117,6 +142,9 @@ def save_final_analysis(test_name: str, run_id: str, verification_results: str):
                 continue
             if found_think and line:
                 verification_summary.append(line)
+        if not found_think:
+            # Results not produced by a reasoning model (e.g. triage) are kept whole
+            verification_summary = [line.strip() for line in verification_results.split('\n') if line.strip()]
         
         # Prepare the analysis data
         analysis_data = {
@@ -125,6 +153,8 @@ def save_final_analysis(test_name: str, run_id: str, verification_results: str):
             "timestamp": datetime.now().isoformat(),
             "verification_results": "\n".join(verification_summary)
         }
+        if triage_report is not None:
+            analysis_data["triage"] = {k: v for k, v in triage_report.items() if k != "screenshots_to_analyze"}
         
         # Save the analysis
         with open(log_file, 'w') as f:
@@ -133,113 +163,114 @@ def save_final_analysis(test_name: str, run_id: str, verification_results: str):
         print(f"\nFinal analysis saved to: {log_file}")
     except Exception as e:
         logger.error(f"Error saving final analysis: {str(e)}")
+        return
 
-def main(test_name: str, run_id: str, use_existing_analysis: bool = True):
-    # Initialize the log analysis agent
+    if not is_indexable_run(run_id):
+        print(f"\nRun ID {run_id} is not timestamped; skipping history comparison")
+        return
+    try:
+        # Compare this run's findings with earlier runs of the same test
+        history = open_history(log_dir)
+        history.add_final_analysis(log_file)
+        print("\n" + format_history_diff(history.diff(test_name, run_id)))
+    except Exception as e:
+        logger.error(f"Error updating analysis history: {str(e)}")
+
+def build_log_analysis_agent():
+    """Initialize the log analysis agent executor"""
     log_analysis_agent = Agent(prompt_text=LOG_ANALYZER_PROMPT, agent_type="log_analyzer")
-    log_analysis_agent_executor = log_analysis_agent.get_agent_executor()
-    
-    # Initialize Groq client for cross-checking
-    client = Groq(
+    return log_analysis_agent.get_agent_executor()
+
+def build_video_analysis_agent():
+    """Initialize the video analysis agent executor"""
+    video_analysis_agent = Agent(prompt_text=VIDEO_ANALYZER_PROMPT, agent_type="video_analyzer")
+    return video_analysis_agent.get_agent_executor()
+
+def build_groq_client():
+    """Initialize Groq client for cross-checking"""
+    return Groq(
         api_key=os.environ.get("GROQ_API_KEY"),
     )
-    
-    # Get the most recent log file
-    try:
-        log_path = get_latest_log_file(test_name, run_id)
-        print(f"\nUsing log file: {log_path}")
-    except Exception as e:
-        print(f"\nError: {str(e)}")
-        return
-        
-    screenshots_dir = f'opt/proofs/{test_name}/{run_id}/screenshots'
-    
-    # First, analyze the log file
+
+def load_existing_analysis(test_name: str, run_id: str) -> list:
+    """Load a previously saved screenshot analysis, if there is one"""
+    print("\nAttempting to use existing screenshot analysis...")
+    print(f"Looking for analysis file: video_analysis_{test_name}_{run_id}.json")
+    screenshot_analysis = get_latest_analysis(test_name, run_id)
+    if not screenshot_analysis:
+        print("No existing analysis found. Running new analysis...")
+        return []
+
+    print(f"Successfully loaded existing analysis with {len(screenshot_analysis)} screenshots")
+    # Verify the analysis data
+    print("\nVerifying analysis data:")
+    print(f"First screenshot path: {screenshot_analysis[0]['screenshot']}")
+    print(f"First screenshot analysis length: {len(screenshot_analysis[0]['analysis'])} characters")
+    return screenshot_analysis
+
+def analyze_log(log_analysis_agent_executor, log_path: str) -> str:
+    """Run the log analysis agent on a log file"""
     log_prompt = f"Analyze the log file at '{log_path}'"
     log_response = log_analysis_agent_executor.invoke({"input": log_prompt})
     print("\nLog Analysis Results:")
     print(log_response["output"])
+    return log_response["output"]
+
+def analyze_screenshots(video_analysis_agent_executor, screenshot_files: list, test_name: str, run_id: str, partial: bool = False) -> list:
+    """Run the video analysis agent on each screenshot and save the results"""
+    print("\nRunning new screenshot analysis...")
+    screenshot_analysis = []
+
+    print("\nAnalyzing screenshots...")
+    for screenshot_path in screenshot_files:
+        try:
+            # Create prompt for this screenshot
+            screenshot_prompt = f"Analyze this screenshot: {screenshot_path}"
+            
+            # Run the video analysis agent with rate limiting
+            max_retries = 3
+            retry_delay = 60  # seconds
+            
+            for attempt in range(max_retries):
+                try:
+                    response = video_analysis_agent_executor.invoke({
+                        "input": screenshot_prompt
+                    })
+                    
+                    # Store the analysis
+                    screenshot_analysis.append({
+                        "screenshot": screenshot_path,
+                        "analysis": response["output"]
+                    })
+                    
+                    print(f"Analyzed: {screenshot_path}")
+                    break  # Success, exit retry loop
+                    
+                except Exception as e:
+                    if "rate_limit_exceeded" in str(e) and attempt < max_retries - 1:
+                        print(f"Rate limit hit, waiting {retry_delay} seconds before retry...")
+                        time.sleep(retry_delay)
+                        continue
+                    else:
+                        raise  # Re-raise if not rate limit or out of retries
+            
+        except Exception as e:
+            logger.error(f"Error analyzing screenshot {screenshot_path}: {str(e)}")
+            continue
     
-    # Get screenshot analysis either from existing file or run new analysis
-    if use_existing_analysis:
-        print("\nAttempting to use existing screenshot analysis...")
-        print(f"Looking for analysis file: video_analysis_{test_name}_{run_id}.json")
-        screenshot_analysis = get_latest_analysis(test_name, run_id)
-        if not screenshot_analysis:
-            print("No existing analysis found. Running new analysis...")
-            use_existing_analysis = False
-        else:
-            print(f"Successfully loaded existing analysis with {len(screenshot_analysis)} screenshots")
-            # Verify the analysis data
-            if screenshot_analysis:
-                print("\nVerifying analysis data:")
-                print(f"First screenshot path: {screenshot_analysis[0]['screenshot']}")
-                print(f"First screenshot analysis length: {len(screenshot_analysis[0]['analysis'])} characters")
-    
-    if not use_existing_analysis:
-        print("\nRunning new screenshot analysis...")
-        # Initialize the video analysis agent
-        video_analysis_agent = Agent(prompt_text=VIDEO_ANALYZER_PROMPT, agent_type="video_analyzer")
-        video_analysis_agent_executor = video_analysis_agent.get_agent_executor()
-        
-        # Analyze each screenshot
-        screenshot_files = get_screenshot_list(screenshots_dir)
-        screenshot_analysis = []
-        
-        print("\nAnalyzing screenshots...")
-        for screenshot_path in screenshot_files:
-            try:
-                # Create prompt for this screenshot
-                screenshot_prompt = f"Analyze this screenshot: {screenshot_path}"
-                
-                # Run the video analysis agent with rate limiting
-                max_retries = 3
-                retry_delay = 60  # seconds
-                
-                for attempt in range(max_retries):
-                    try:
-                        response = video_analysis_agent_executor.invoke({
-                            "input": screenshot_prompt
-                        })
-                        
-                        # Store the analysis
-                        screenshot_analysis.append({
-                            "screenshot": screenshot_path,
-                            "analysis": response["output"]
-                        })
-                        
-                        print(f"Analyzed: {screenshot_path}")
-                        break  # Success, exit retry loop
-                        
-                    except Exception as e:
-                        if "rate_limit_exceeded" in str(e) and attempt < max_retries - 1:
-                            print(f"Rate limit hit, waiting {retry_delay} seconds before retry...")
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            raise  # Re-raise if not rate limit or out of retries
-                
-            except Exception as e:
-                logger.error(f"Error analyzing screenshot {screenshot_path}: {str(e)}")
-                continue
-        
-        # Save new analysis to log file
-        save_analysis_to_log(screenshot_analysis, test_name, run_id)
-    
+    # Save new analysis to log file
+    save_analysis_to_log(screenshot_analysis, test_name, run_id, partial=partial)
+    return screenshot_analysis
+
+def summarize_screenshot_analysis(screenshot_analysis: list) -> list:
+    """Extract key information from screenshot analyses"""
     # Print all screenshot analyses
     print("\nScreenshot Analysis Results:")
     for analysis in screenshot_analysis:
         print(f"\nScreenshot: {analysis['screenshot']}")
         print(analysis['analysis'])
         print("-" * 80)
-    
-    # Run cross-check analysis using Groq with DeepSeek model
-    print("\nRunning cross-check analysis...")
-    
-    # Create a more detailed summary of the analyses
-    log_summary = log_response['output']  # Use full log analysis
-    
-    # Extract key information from screenshot analyses
+
     screenshot_summary = []
     for analysis in screenshot_analysis:
         # Extract the key points from the structured analysis
@@ -254,11 +285,30 @@ def main(test_name: str, run_id: str, use_existing_analysis: bool = True):
             'ui_elements': ui_elements,
             'interactions': interactions
         })
-    
+    return screenshot_summary
+
+def format_triage_section(triage_notes: str, partial_analysis: bool) -> str:
+    """Prompt section describing the local triage results, if any"""
+    if not triage_notes:
+        return ""
+    caveat = ""
+    if partial_analysis:
+        caveat = "Screenshots not listed in the summary passed these local checks and were not sent for analysis; do not report them as missing."
+    return f'''
+    Local Pre-Screening (console errors, HTTP errors and screenshot pixel changes):
+    {triage_notes}
+    {caveat}
+    '''
+
+def run_cross_check(client, log_summary: str, screenshot_summary: list, triage_notes: str = "", partial_analysis: bool = False) -> list:
+    """Run cross-check analysis using Groq with DeepSeek model and return its conclusions"""
+    print("\nRunning cross-check analysis...")
     print("\nPreparing cross-check data:")
     print(f"Log Analysis Length: {len(log_summary)} characters")
     print(f"Number of screenshots to cross-check: {len(screenshot_summary)}")
     
+    triage_section = format_triage_section(triage_notes, partial_analysis)
+
     cross_check_prompt = f'''Compare these analyses and identify genuine gaps:
 
     Log Analysis:
@@ -266,7 +316,7 @@ def main(test_name: str, run_id: str, use_existing_analysis: bool = True):
     
     Screenshot Analysis Summary:
     {json.dumps(screenshot_summary, indent=2)}
-    
+    {triage_section}
     Please provide a detailed analysis of:
     1. Genuine Missing Evidence: List only steps that are truly missing from screenshots, after verifying the actual content of each screenshot
     2. Actual Sequence Issues: Note only real sequence mismatches, based on the actual content of screenshots
@@ -288,95 +338,186 @@ def main(test_name: str, run_id: str, use_existing_analysis: bool = True):
     
     Please be this precise in your analysis.'''
     
+    print("\nSending cross-check request to DeepSeek...")
+    chat_completion = client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": "You are a test analysis comparison assistant. Focus on identifying only genuine gaps by carefully analyzing the actual content of the screenshot analyses. Be precise and avoid making assumptions."},
+            {"role": "user", "content": cross_check_prompt}
+        ],
+        model="deepseek-r1-distill-llama-70b",
+        temperature=0.0
+    )
+    
+    initial_analysis = chat_completion.choices[0].message.content
+    print("\nInitial Cross-Check Results:")
+    print(initial_analysis)
+    
+    # Extract only the conclusions after </think>
+    conclusions = []
+    found_think = False
+    for line in initial_analysis.split('\n'):
+        line = line.strip()
+        if '</think>' in line:
+            found_think = True
+            continue
+        if found_think and line:
+            conclusions.append(line)
+    
+    print("\nConclusions to verify:")
+    for conclusion in conclusions:
+        print(conclusion)
+    return conclusions
+
+def run_verification(client, conclusions: list, screenshot_summary: list, triage_notes: str = "", partial_analysis: bool = False) -> str:
+    """Verify the cross-check conclusions against the screenshot data"""
+    print("\nPerforming verification of initial analysis...")
+    triage_section = format_triage_section(triage_notes, partial_analysis)
+    verification_prompt = f'''Please verify these conclusions against the actual screenshot data:
+
+    Conclusions to Verify:
+    {chr(10).join(conclusions)}
+    
+    Screenshot Analysis Summary:
+    {json.dumps(screenshot_summary, indent=2)}
+    {triage_section}
+    For each conclusion, verify if it's correct by checking the actual screenshot data.
+    Format your response as:
+    
+    VERIFICATION RESULTS:
+    
+    1. Confirmed Conclusions (with evidence):
+       - List conclusions that are accurate with screenshot evidence
+       - Include the specific screenshot number/ID where the evidence was found
+    
+    2. Incorrect Conclusions (with actual evidence):
+       - List conclusions that were wrong with screenshot evidence
+       - Specify which screenshots were checked and what was actually found
+       - If a step is missing, identify between which screenshots it should have occurred
+    
+    3. Final Summary:
+       - List each missing step and specify:
+         * Between which screenshots it should have occurred
+         * What evidence we have before and after the missing step
+         * Any partial evidence of the step being attempted
+    
+    Be extremely precise and only make claims you can verify with the actual data.'''
+    
+    # Using temperature=0 for deterministic, factual responses
+    # This ensures consistent verification results and reduces hallucinations
+    verification_completion = client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": "You are a verification assistant. Your job is to fact-check conclusions against the actual screenshot data. Be extremely precise and only make claims you can verify."},
+            {"role": "user", "content": verification_prompt}
+        ],
+        model="deepseek-r1-distill-llama-70b",
+        temperature=0.0
+    )
+    
+    verification_results = verification_completion.choices[0].message.content
+    print("\nVerification Results:")
+    print(verification_results)
+    return verification_results
+
+def main(test_name: str, run_id: str, use_existing_analysis: bool = True, prewarm: bool = True, triage: bool = True):
+    # Get the most recent log file
     try:
-        print("\nSending cross-check request to DeepSeek...")
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a test analysis comparison assistant. Focus on identifying only genuine gaps by carefully analyzing the actual content of the screenshot analyses. Be precise and avoid making assumptions."},
-                {"role": "user", "content": cross_check_prompt}
-            ],
-            model="deepseek-r1-distill-llama-70b",
-            temperature=0.0
-        )
-        
-        initial_analysis = chat_completion.choices[0].message.content
-        print("\nInitial Cross-Check Results:")
-        print(initial_analysis)
-        
-        # Extract only the conclusions after </think>
-        conclusions = []
-        found_think = False
-        for line in initial_analysis.split('\n'):
-            line = line.strip()
-            if '</think>' in line:
-                found_think = True
-                continue
-            if found_think and line:
-                conclusions.append(line)
-        
-        print("\nConclusions to verify:")
-        for conclusion in conclusions:
-            print(conclusion)
-        
-        # Second verification pass
-        print("\nPerforming verification of initial analysis...")
-        verification_prompt = f'''Please verify these conclusions against the actual screenshot data:
+        log_path = get_latest_log_file(test_name, run_id)
+        print(f"\nUsing log file: {log_path}")
+    except Exception as e:
+        print(f"\nError: {str(e)}")
+        return
 
-        Conclusions to Verify:
-        {chr(10).join(conclusions)}
-        
-        Screenshot Analysis Summary:
-        {json.dumps(screenshot_summary, indent=2)}
-        
-        For each conclusion, verify if it's correct by checking the actual screenshot data.
-        Format your response as:
-        
-        VERIFICATION RESULTS:
-        
-        1. Confirmed Conclusions (with evidence):
-           - List conclusions that are accurate with screenshot evidence
-           - Include the specific screenshot number/ID where the evidence was found
-        
-        2. Incorrect Conclusions (with actual evidence):
-           - List conclusions that were wrong with screenshot evidence
-           - Specify which screenshots were checked and what was actually found
-           - If a step is missing, identify between which screenshots it should have occurred
-        
-        3. Final Summary:
-           - List each missing step and specify:
-             * Between which screenshots it should have occurred
-             * What evidence we have before and after the missing step
-             * Any partial evidence of the step being attempted
-        
-        Be extremely precise and only make claims you can verify with the actual data.'''
-        
-        # Using temperature=0 for deterministic, factual responses
-        # This ensures consistent verification results and reduces hallucinations
-        verification_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a verification assistant. Your job is to fact-check conclusions against the actual screenshot data. Be extremely precise and only make claims you can verify."},
-                {"role": "user", "content": verification_prompt}
-            ],
-            model="deepseek-r1-distill-llama-70b",
-            temperature=0.0
-        )
-        
-        verification_results = verification_completion.choices[0].message.content
-        print("\nVerification Results:")
-        print(verification_results)
+    # Score the run from local signals before paying for any model calls
+    triage_report = None
+    triage_notes = ""
+    if triage:
+        triage_report = triage_run(test_name, run_id, log_path)
+        triage_notes = format_triage_report(triage_report)
+        print("\n" + triage_notes)
+        print(f"Triage completed in {triage_report['elapsed_ms']} ms")
+        if triage_report["verdict"] == "clean":
+            save_final_analysis(
+                test_name=test_name,
+                run_id=run_id,
+                verification_results=triage_notes,
+                triage_report=triage_report
+            )
+            return
         
+    screenshots_dir = f'opt/proofs/{test_name}/{run_id}/screenshots'
+    # Set once a fresh analysis covers only the screenshots triage flagged
+    partial_analysis = False
+
+    # The video agent is pre-warmed speculatively in its own stage; the
+    # screenshot branch only waits for it when it actually needs the agent
+    prewarm_video_agent = prewarm or not use_existing_analysis
+    prewarmed_video_agent = Future()
+
+    def screenshot_analysis_stage(existing_analysis, screenshot_files):
+        nonlocal partial_analysis
+        if existing_analysis:
+            return existing_analysis
+        partial_analysis = triage_report is not None and triage_report["verdict"] == "suspicious_steps"
+        video_agent = prewarmed_video_agent.result() if prewarm_video_agent else None
+        # Fall back to building the agent here if it was not pre-warmed
+        return analyze_screenshots(video_agent or build_video_analysis_agent(), screenshot_files, test_name, run_id,
+                                   partial=partial_analysis)
+
+    def video_agent_stage():
+        # Pre-warming is speculative and must never fail the run;
+        # screenshot_analysis_stage builds the agent itself if needed
+        video_agent = None
+        try:
+            video_agent = build_video_analysis_agent()
+        except Exception as e:
+            logger.warning(f"Could not pre-warm video analysis agent: {str(e)}")
+        prewarmed_video_agent.set_result(video_agent)
+        return video_agent
+
+    def verification_stage(groq_client, cross_check, screenshot_summary):
+        verification_results = run_verification(groq_client, cross_check, screenshot_summary, triage_notes, partial_analysis)
         # Save the final analysis
         save_final_analysis(
             test_name=test_name,
             run_id=run_id,
-            verification_results=verification_results
+            verification_results=verification_results,
+            triage_report=triage_report
         )
-        
-    except Exception as e:
-        logger.error(f"Error during cross-check analysis: {str(e)}")
-        print(f"\nError during cross-check analysis: {str(e)}")
+        return verification_results
+
+    # The log and screenshot branches are independent; agent and client
+    # construction overlaps with the screenshot directory scan. Each stage's
+    # output is printed as one block when the stage finishes.
+    pipeline = Pipeline()
+    pipeline.add_stage("log_agent", build_log_analysis_agent)
+    pipeline.add_stage("groq_client", build_groq_client)
+    if prewarm_video_agent:
+        pipeline.add_stage("video_agent", video_agent_stage)
+    if triage_report is not None:
+        # Only the screenshots triage flagged are sent to the vision model
+        pipeline.add_stage("screenshot_files", lambda: triage_report["screenshots_to_analyze"])
+    else:
+        pipeline.add_stage("screenshot_files", lambda: get_screenshot_list(screenshots_dir))
+    pipeline.add_stage("existing_analysis", lambda: load_existing_analysis(test_name, run_id) if use_existing_analysis else [])
+    pipeline.add_stage("log_analysis", lambda log_agent: analyze_log(log_agent, log_path), depends_on=["log_agent"])
+    pipeline.add_stage("screenshot_analysis", screenshot_analysis_stage,
+                       depends_on=["existing_analysis", "screenshot_files"])
+    pipeline.add_stage("screenshot_summary", summarize_screenshot_analysis,
+                       depends_on=["screenshot_analysis"])
+    pipeline.add_stage("cross_check", lambda groq_client, log_analysis, screenshot_summary: run_cross_check(groq_client, log_analysis, screenshot_summary, triage_notes, partial_analysis),
+                       depends_on=["groq_client", "log_analysis", "screenshot_summary"])
+    pipeline.add_stage("verification", verification_stage,
+                       depends_on=["groq_client", "cross_check", "screenshot_summary"])
+    pipeline.run()
+
+    errors = pipeline.errors()
+    if errors:
+        for name, error in errors.items():
+            print(f"\nError during {name.replace('_', ' ')}: {str(error)}")
         print("Please check the logs for details.")
 
+    pipeline.print_timings()
+
 if __name__ == "__main__":
     # Example test name and run ID
     test_name = "Search_for_a_product,_add_to_cart,_and_verify_cart_contents"
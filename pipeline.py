@@ -0,0 +1,189 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import io
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    """A single unit of work in the analysis pipeline"""
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.result = None
+        self.error = None
+        self.skipped = False
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def duration(self):
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+class _StageOutput:
+    """sys.stdout replacement that buffers writes made from stage threads"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            return self.stream.write(text)
+        return buffer.write(text)
+
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class Pipeline:
+    """Small DAG executor that runs independent stages concurrently.
+
+    Each stage is called with the results of its dependencies as keyword
+    arguments (keyed by dependency name) and is started as soon as all of
+    them have finished. If a stage fails, every stage depending on it is
+    skipped while unrelated branches keep running.
+
+    With `buffer_output` (the default), everything a stage prints is held
+    back and written in one block when the stage finishes, so concurrent
+    stages do not interleave their output.
+    """
+    def __init__(self, max_workers: int = 8, buffer_output: bool = True):
+        self.max_workers = max_workers
+        self.buffer_output = buffer_output
+        self._output = None
+        self._output_lock = threading.Lock()
+        self.stages = {}
+        self.started_at = None
+        self.finished_at = None
+
+    def add_stage(self, name: str, func, depends_on=()):
+        """Register a stage; dependencies must already be registered"""
+        if name in self.stages:
+            raise ValueError(f"Stage already registered: {name}")
+        for dep in depends_on:
+            if dep not in self.stages:
+                raise ValueError(f"Unknown dependency '{dep}' for stage '{name}'")
+        self.stages[name] = Stage(name, func, depends_on)
+        return self
+
+    def _run_stage(self, stage: Stage):
+        kwargs = {dep: self.stages[dep].result for dep in stage.depends_on}
+        if self._output is not None:
+            self._output.local.buffer = io.StringIO()
+        stage.start_time = time.perf_counter()
+        try:
+            return stage.func(**kwargs)
+        finally:
+            stage.end_time = time.perf_counter()
+            if self._output is not None:
+                text = self._output.local.buffer.getvalue()
+                self._output.local.buffer = None
+                with self._output_lock:
+                    self._output.stream.write(text)
+                    self._output.stream.flush()
+
+    def run(self) -> dict:
+        """Execute all stages and return a mapping of stage name to result"""
+        self.started_at = time.perf_counter()
+        if self.buffer_output:
+            self._output = _StageOutput(sys.stdout)
+            sys.stdout = self._output
+        try:
+            self._schedule()
+        finally:
+            if self._output is not None:
+                sys.stdout = self._output.stream
+                self._output = None
+
+        self.finished_at = time.perf_counter()
+        return {name: stage.result for name, stage in self.stages.items()}
+
+    def _schedule(self):
+        pending = dict(self.stages)
+        running = {}
+        done = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # Skip anything that depends on a failed or skipped stage
+                for name, stage in list(pending.items()):
+                    blocked = [dep for dep in stage.depends_on
+                               if self.stages[dep].error is not None or self.stages[dep].skipped]
+                    if blocked:
+                        stage.skipped = True
+                        logger.warning(f"Skipping stage '{name}' because '{blocked[0]}' did not complete")
+                        done.add(name)
+                        del pending[name]
+
+                # Start every stage whose inputs are ready
+                for name, stage in list(pending.items()):
+                    if all(dep in done for dep in stage.depends_on):
+                        running[executor.submit(self._run_stage, stage)] = stage
+                        del pending[name]
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        stage.result = future.result()
+                    except Exception as e:
+                        stage.error = e
+                        logger.error(f"Stage '{stage.name}' failed: {str(e)}")
+                    done.add(stage.name)
+
+    def errors(self) -> dict:
+        """Get the exceptions raised by failed stages"""
+        return {name: stage.error for name, stage in self.stages.items() if stage.error is not None}
+
+    def critical_path(self) -> list:
+        """Get the chain of stages that determined the total wall-clock time.
+
+        Starting from the stage that finished last, walk back through the
+        dependency that finished last at each step.
+        """
+        completed = [s for s in self.stages.values() if s.end_time is not None]
+        if not completed:
+            return []
+
+        path = []
+        stage = max(completed, key=lambda s: s.end_time)
+        while stage is not None:
+            path.append(stage)
+            deps = [self.stages[dep] for dep in stage.depends_on
+                    if self.stages[dep].end_time is not None]
+            stage = max(deps, key=lambda s: s.end_time) if deps else None
+        return list(reversed(path))
+
+    def print_timings(self):
+        """Print per-stage timings and the critical path"""
+        if self.started_at is None:
+            return
+
+        print("\nPipeline Stage Timings:")
+        for stage in sorted(self.stages.values(), key=lambda s: s.start_time or float("inf")):
+            if stage.skipped:
+                print(f"  {stage.name:<24} skipped")
+                continue
+            if stage.start_time is None:
+                continue
+            offset = stage.start_time - self.started_at
+            status = "failed" if stage.error is not None else "ok"
+            print(f"  {stage.name:<24} start +{offset:7.2f}s  took {stage.duration:7.2f}s  {status}")
+
+        path = self.critical_path()
+        total = self.finished_at - self.started_at
+        print(f"\nCritical path ({total:.2f}s total):")
+        for stage in path:
+            share = (stage.duration / total * 100) if total > 0 else 0.0
+            print(f"  {stage.name:<24} {stage.duration:7.2f}s  ({share:5.1f}%)")
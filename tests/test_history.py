@@ -0,0 +1,227 @@
+import json
+
+import pytest
+
+from history import AnalysisHistory, format_history_diff, is_indexable_run, normalize_finding, parse_findings
+
+TEST_NAME = "Search_for_a_product"
+
+
+def verification_text(*titles):
+    lines = ["VERIFICATION RESULTS:", "1. Confirmed Conclusions (with evidence):"]
+    lines += [f"- {title}: details for {title}" for title in titles]
+    lines += ["2. Incorrect Conclusions (with actual evidence):", "- None of the conclusions are incorrect."]
+    lines += ["3. Final Summary:", "- Something else: not a confirmed finding"]
+    return "\n".join(lines)
+
+
+def write_final(log_dir, run_id, *titles, triage_verdict=None):
+    path = log_dir / f"final_analysis_{TEST_NAME}_{run_id}.json"
+    analysis_data = {
+        "test_name": TEST_NAME,
+        "run_id": run_id,
+        "verification_results": verification_text(*titles),
+    }
+    if triage_verdict:
+        analysis_data["triage"] = {"verdict": triage_verdict, "score": 0.0, "reasons": []}
+    path.write_text(json.dumps(analysis_data))
+    return path
+
+
+def write_screenshots(log_dir, run_id, *names):
+    path = log_dir / f"video_analysis_{TEST_NAME}_{run_id}.json"
+    path.write_text(json.dumps([
+        {"screenshot": f"opt\\proofs\\screenshots\\{name}", "analysis": "..."} for name in names
+    ]))
+    return path
+
+
+def test_parse_findings_reads_only_confirmed_section():
+    findings = parse_findings(verification_text("Missing Login Process", "**Verification Gaps**"))
+
+    assert list(findings) == ["missing login process", "verification gaps"]
+
+
+@pytest.mark.parametrize("header", [
+    "1. Confirmed Conclusions (with evidence):",
+    "**1. Confirmed Conclusions (with evidence):**",
+    "### 1. Confirmed Conclusions",
+    "## Confirmed Conclusions",
+])
+def test_parse_findings_accepts_markdown_headings(header):
+    text = "\n".join([
+        "VERIFICATION RESULTS:",
+        header,
+        "- **Missing Login Process**: no login screenshot",
+        "### 2. Incorrect Conclusions",
+        "- Cart Page Missing: the cart page is shown",
+        "**3. Final Summary:**",
+        "- Missing Login Process: between openurl screenshots",
+    ])
+
+    assert list(parse_findings(text)) == ["missing login process"]
+
+
+def test_parse_findings_accepts_numbered_findings_with_sub_bullets():
+    text = "\n".join([
+        "**1. Confirmed Conclusions (with evidence):**",
+        "1. Missing Login Process: no login screenshot",
+        "   - Evidence: openurl_end_1.png shows the inventory page",
+        "2. Verification Gaps: no cart badge checks",
+        "**2. Incorrect Conclusions (with actual evidence):**",
+        "1. Cart Page Missing: the cart page is shown",
+    ])
+
+    findings = parse_findings(text)
+
+    assert list(findings) == ["missing login process", "verification gaps"]
+    assert findings["verification gaps"] == "Verification Gaps: no cart badge checks"
+
+
+def test_normalize_finding_ignores_details_and_punctuation():
+    assert normalize_finding("- Incomplete 'Add to Cart' Verification: lacks the click") == \
+        normalize_finding("* incomplete add to cart verification: other wording")
+
+
+def test_is_indexable_run():
+    assert is_indexable_run("run_20250607_134626")
+    assert not is_indexable_run("nightly")
+
+
+def test_diff_reports_new_resolved_and_persistent(tmp_path):
+    history = AnalysisHistory(tmp_path, window=2)
+    history.add_final_analysis(write_final(tmp_path, "run_20250601_000000", "A", "B"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_000000", "A", "C"))
+
+    diff = history.diff(TEST_NAME)
+
+    assert diff["compared_with"] == ["run_20250601_000000"]
+    assert list(diff["new"]) == ["c"]
+    assert list(diff["resolved"]) == ["b"]
+    assert diff["persistent"]["a"]["previous_occurrences"] == 1
+
+
+def test_resolved_only_covers_most_recent_compared_run(tmp_path):
+    history = AnalysisHistory(tmp_path, window=3)
+    history.add_final_analysis(write_final(tmp_path, "run_20250601_000000", "A", "B"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_000000", "A"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250603_000000"))
+
+    diff = history.diff(TEST_NAME)
+
+    # "b" was already gone in the previous run, so this run did not resolve it
+    assert list(diff["resolved"]) == ["a"]
+
+
+@pytest.mark.parametrize("verdict", ["clean", "suspicious_steps"])
+def test_triage_only_run_is_labelled_and_not_a_baseline(tmp_path, verdict):
+    history = AnalysisHistory(tmp_path)
+    history.add_final_analysis(write_final(tmp_path, "run_20250601_000000", "A"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_000000", triage_verdict=verdict))
+    history.add_final_analysis(write_final(tmp_path, "run_20250603_000000", "A"))
+
+    triage_diff = history.diff(TEST_NAME, "run_20250602_000000")
+    assert triage_diff["triage_verdict"] == verdict
+    assert triage_diff["resolved"] == {}
+    assert "triage only" in format_history_diff(triage_diff)
+
+    diff = history.diff(TEST_NAME)
+    assert diff["compared_with"] == ["run_20250601_000000"]
+    assert list(diff["persistent"]) == ["a"]
+    assert diff["new"] == {}
+
+
+def test_suspicious_run_triage_is_a_baseline(tmp_path):
+    history = AnalysisHistory(tmp_path)
+    history.add_final_analysis(write_final(tmp_path, "run_20250601_000000", "A", triage_verdict="suspicious_run"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_000000"))
+
+    diff = history.diff(TEST_NAME)
+    assert "triage_verdict" not in diff
+    assert list(diff["resolved"]) == ["a"]
+
+
+def test_diff_window_limits_compared_runs(tmp_path):
+    history = AnalysisHistory(tmp_path, window=1)
+    history.add_final_analysis(write_final(tmp_path, "run_20250601_000000", "A"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_000000"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250603_000000", "A"))
+
+    assert list(history.diff(TEST_NAME)["new"]) == ["a"]
+    assert list(history.diff(TEST_NAME, window=2)["persistent"]) == ["a"]
+
+
+def test_stored_diffs_match_recomputation_after_out_of_order_updates(tmp_path):
+    history = AnalysisHistory(tmp_path, window=1)
+    history.add_final_analysis(write_final(tmp_path, "run_20250601_000000", "A"))
+    history.add_screenshot_analysis(write_screenshots(tmp_path, "run_20250602_000000", "click_start_1.png"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250603_000000", "A", "B"))
+
+    # Re-analysing the first run must refresh the diff of the third run,
+    # even though a screenshot-only run sits between them
+    path = write_final(tmp_path, "run_20250601_000000", "A", "B", "C")
+    history.index["tests"][TEST_NAME]["runs"]["run_20250601_000000"]["final"]["mtime"] = 0
+    history.add_final_analysis(path)
+
+    stored = history.diff(TEST_NAME, "run_20250603_000000")
+    assert stored["new"] == {}
+    assert sorted(stored["persistent"]) == ["a", "b"]
+
+    # Inserting an older run in the middle keeps every stored diff consistent,
+    # and triage-only runs do not count towards the window
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_120000", "D"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_180000", triage_verdict="clean"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_060000", "E"))
+    test = history.index["tests"][TEST_NAME]
+    for position, run_id in enumerate(test["order"]):
+        assert test["runs"][run_id]["diff"] == history._compute_diff(test, position, history.window)
+
+
+def test_screenshot_diff_against_previous_screenshot_analysis(tmp_path):
+    history = AnalysisHistory(tmp_path)
+    history.add_screenshot_analysis(write_screenshots(
+        tmp_path, "run_20250601_000000", "click_start_1.png", "click_end_2.png", "hover_start_3.png"))
+    history.add_final_analysis(write_final(tmp_path, "run_20250602_000000", "A"))
+    history.add_screenshot_analysis(write_screenshots(
+        tmp_path, "run_20250603_000000", "click_start_4.png", "click_end_5.png", "click_end_6.png"))
+
+    screenshots = history.diff(TEST_NAME, "run_20250603_000000")["screenshots"]
+
+    assert screenshots["compared_with"] == "run_20250601_000000"
+    assert screenshots["added"] == {"click_end": 1}
+    assert screenshots["removed"] == {"hover_start": 1}
+
+
+def test_sync_indexes_only_new_files_and_persists(tmp_path):
+    write_final(tmp_path, "run_20250601_000000", "A")
+    write_screenshots(tmp_path, "run_20250601_000000", "click_start_1.png")
+    (tmp_path / f"partial_video_analysis_{TEST_NAME}_run_20250601_000000.json").write_text("[]")
+
+    assert AnalysisHistory(tmp_path).sync() == 2
+    reloaded = AnalysisHistory(tmp_path)
+    assert reloaded.sync() == 0
+    assert reloaded.runs(TEST_NAME) == ["run_20250601_000000"]
+
+
+def test_diff_unknown_run_raises(tmp_path):
+    history = AnalysisHistory(tmp_path)
+
+    with pytest.raises(KeyError):
+        history.diff(TEST_NAME)
+
+
+@pytest.mark.parametrize("content", ['{"tests": []}', '{"window": 5, "tests": {"x": {"order": []}}}', "{not json"])
+def test_corrupt_index_is_rebuilt_from_analysis_files(tmp_path, content):
+    write_final(tmp_path, "run_20250601_000000", "A")
+    write_final(tmp_path, "run_20250602_000000", "A", "B")
+    (tmp_path / "history_index.json").write_text(content)
+
+    history = AnalysisHistory(tmp_path)
+    assert history.rebuilt
+    history.sync()
+
+    assert history.runs(TEST_NAME) == ["run_20250601_000000", "run_20250602_000000"]
+    assert list(history.diff(TEST_NAME)["new"]) == ["b"]
+    reloaded = AnalysisHistory(tmp_path)
+    assert not reloaded.rebuilt
+    assert reloaded.runs(TEST_NAME) == ["run_20250601_000000", "run_20250602_000000"]
@@ -0,0 +1,103 @@
+import sys
+import time
+
+import pytest
+
+from pipeline import Pipeline
+
+
+def test_stages_receive_dependency_results():
+    pipeline = Pipeline()
+    pipeline.add_stage("a", lambda: 1)
+    pipeline.add_stage("b", lambda: 2)
+    pipeline.add_stage("total", lambda a, b: a + b, depends_on=["a", "b"])
+
+    results = pipeline.run()
+
+    assert results == {"a": 1, "b": 2, "total": 3}
+    assert pipeline.errors() == {}
+
+
+def test_independent_stages_run_concurrently():
+    pipeline = Pipeline()
+    pipeline.add_stage("a", lambda: time.sleep(0.2))
+    pipeline.add_stage("b", lambda: time.sleep(0.2))
+
+    started = time.perf_counter()
+    pipeline.run()
+
+    assert time.perf_counter() - started < 0.35
+
+
+def test_failure_skips_dependents_only():
+    def fail():
+        raise RuntimeError("boom")
+
+    pipeline = Pipeline()
+    pipeline.add_stage("bad", fail)
+    pipeline.add_stage("good", lambda: "ok")
+    pipeline.add_stage("child", lambda bad: bad, depends_on=["bad"])
+    pipeline.add_stage("grandchild", lambda child: child, depends_on=["child"])
+    pipeline.add_stage("other", lambda good: good + "!", depends_on=["good"])
+
+    results = pipeline.run()
+
+    assert list(pipeline.errors()) == ["bad"]
+    assert pipeline.stages["child"].skipped
+    assert pipeline.stages["grandchild"].skipped
+    assert not pipeline.stages["other"].skipped
+    assert results["other"] == "ok!"
+
+
+def test_critical_path_follows_slowest_dependency():
+    pipeline = Pipeline()
+    pipeline.add_stage("fast", lambda: time.sleep(0.05))
+    pipeline.add_stage("slow", lambda: time.sleep(0.2))
+    pipeline.add_stage("side", lambda: None)
+    pipeline.add_stage("join", lambda fast, slow: None, depends_on=["fast", "slow"])
+    pipeline.run()
+
+    assert [stage.name for stage in pipeline.critical_path()] == ["slow", "join"]
+
+
+def test_critical_path_empty_before_run():
+    pipeline = Pipeline()
+    pipeline.add_stage("a", lambda: None)
+
+    assert pipeline.critical_path() == []
+
+
+def test_add_stage_rejects_unknown_and_duplicate_stages():
+    pipeline = Pipeline()
+    pipeline.add_stage("a", lambda: None)
+
+    with pytest.raises(ValueError):
+        pipeline.add_stage("a", lambda: None)
+    with pytest.raises(ValueError):
+        pipeline.add_stage("b", lambda missing: None, depends_on=["missing"])
+
+
+def test_concurrent_stage_output_is_not_interleaved(capsys):
+    def chatty(label):
+        def stage():
+            for i in range(3):
+                print(f"{label} {i}")
+                time.sleep(0.02)
+            return label
+        return stage
+
+    pipeline = Pipeline()
+    pipeline.add_stage("a", chatty("a"))
+    pipeline.add_stage("b", chatty("b"))
+    pipeline.run()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert sorted([lines[:3], lines[3:]]) == [["a 0", "a 1", "a 2"], ["b 0", "b 1", "b 2"]]
+
+
+def test_pipeline_restores_stdout():
+    stdout = sys.stdout
+    Pipeline(buffer_output=False).add_stage("a", lambda: None).run()
+    Pipeline().add_stage("a", lambda: None).run()
+
+    assert sys.stdout is stdout
@@ -0,0 +1,159 @@
+import json
+
+from triage import pair_screenshots, score_run, triage_run, PIXEL_CHANGE_THRESHOLD
+
+PLAN = [
+    {"step_number": 1, "description": "Navigate to 'https://www.saucedemo.com'."},
+    {"step_number": 2, "description": "Click the 'Login' button."},
+    {"step_number": 3, "description": "Verify that the inventory page is displayed."},
+]
+
+APP_REQUEST = {"type": "request", "timestamp": 100.0, "url": "https://www.saucedemo.com/"}
+
+
+def shot(action, phase, seconds):
+    return f"screenshots/{action}_{phase}_{int(seconds * 1e9)}.png"
+
+
+def captured_actions(changed=1.0):
+    actions = pair_screenshots([
+        shot("openurl", "start", 100), shot("openurl", "end", 101),
+        shot("click", "start", 110), shot("click", "end", 111),
+        shot("press_key_combination", "end", 115),
+    ])
+    for action in actions:
+        if action["start"] and action["end"]:
+            action["changed"] = changed
+    return actions
+
+
+def console_error(seconds, url="https://www.saucedemo.com/static/js/main.js", text="Uncaught TypeError: cart is undefined"):
+    return {"type": "console", "level": "error", "timestamp": seconds, "text": text, "location": {"url": url}}
+
+
+def test_pair_screenshots_matches_starts_with_ends():
+    actions = pair_screenshots([
+        shot("click", "end", 2), shot("click", "start", 1),
+        shot("press_key_combination", "end", 3),
+        shot("hover", "start", 4),
+        "screenshots/not_a_screenshot.png",
+    ])
+
+    assert [(a["action"], bool(a["start"]), bool(a["end"])) for a in actions] == [
+        ("click", True, True),
+        ("press_key_combination", False, True),
+        ("hover", True, False),
+    ]
+    assert actions[0]["start_time"] == 1.0
+    assert actions[0]["end_time"] == 2.0
+
+
+def test_pair_screenshots_restarted_action_is_unfinished():
+    actions = pair_screenshots([shot("click", "start", 1), shot("click", "start", 2), shot("click", "end", 3)])
+
+    assert actions[0]["end"] is None
+    assert actions[1]["start_time"] == 2.0 and actions[1]["end_time"] == 3.0
+
+
+def test_clean_run_has_no_reasons():
+    report = score_run(PLAN, captured_actions(), [], [APP_REQUEST])
+
+    assert report["verdict"] == "clean"
+    assert report["reasons"] == []
+    # End-only key presses are not counted as evidence for plan steps
+    assert report["captured_actions"] == 2
+
+
+def test_third_party_errors_do_not_affect_verdict():
+    errors = [console_error(110.5, url="https://events.backtrace.io/api/submit", text="401") for _ in range(50)]
+    report = score_run(PLAN, captured_actions(), errors, [APP_REQUEST])
+
+    assert report["verdict"] == "clean"
+    assert report["score"] == 0
+    assert report["ignored_third_party_errors"] == 50
+
+
+def test_first_party_error_during_action_routes_its_screenshots():
+    report = score_run(PLAN, captured_actions(), [console_error(110.5)], [APP_REQUEST])
+
+    assert report["verdict"] == "suspicious_steps"
+    assert sorted(report["flagged"]) == [shot("click", "end", 111), shot("click", "start", 110)]
+
+
+def test_unattributed_first_party_error_escalates_run():
+    report = score_run(PLAN, captured_actions(), [console_error(200.0)], [APP_REQUEST])
+
+    assert report["verdict"] == "suspicious_run"
+    assert report["score"] < 1.0
+    assert "not attributable" in report["reasons"][0]
+
+
+def test_error_without_url_counts_as_first_party():
+    report = score_run(PLAN, captured_actions(), [console_error(200.0, url="")], [APP_REQUEST])
+
+    assert report["verdict"] == "suspicious_run"
+
+
+def test_http_server_error_is_first_party_finding():
+    response = {"type": "response", "timestamp": 110.2, "status": 503, "url": "https://api.saucedemo.com/cart"}
+    report = score_run(PLAN, captured_actions(), [], [APP_REQUEST, response])
+
+    assert report["verdict"] == "suspicious_steps"
+    assert report["reasons"][0].startswith("Http server error")
+
+
+def test_missing_evidence_escalates_run():
+    actions = [a for a in captured_actions() if a["action"] != "click"]
+    report = score_run(PLAN, actions, [], [APP_REQUEST])
+
+    assert report["verdict"] == "suspicious_run"
+    assert report["flagged"] == {}
+
+
+def test_unchanged_screenshot_pair_is_flagged():
+    report = score_run(PLAN, captured_actions(changed=PIXEL_CHANGE_THRESHOLD / 2), [], [APP_REQUEST])
+
+    assert report["verdict"] == "suspicious_steps"
+    assert len(report["flagged"]) == 4
+
+
+def test_missing_plan_escalates_run():
+    report = score_run([], captured_actions(), [], [APP_REQUEST])
+
+    assert report["verdict"] == "suspicious_run"
+
+
+def test_unchanged_hover_is_not_a_finding():
+    actions = captured_actions() + pair_screenshots([shot("hover", "start", 120), shot("hover", "end", 121)])
+    actions[-1]["changed"] = 0.0
+    report = score_run(PLAN, actions, [], [APP_REQUEST])
+
+    assert report["verdict"] == "clean"
+
+
+def test_unreadable_screenshots_escalate_run():
+    actions = captured_actions()
+    actions[0]["unreadable"] = True
+    report = score_run(PLAN, actions, [], [APP_REQUEST])
+
+    assert report["verdict"] == "suspicious_run"
+    assert "could not be compared" in report["reasons"][0]
+
+
+def test_triage_run_treats_corrupt_png_as_finding(tmp_path, monkeypatch):
+    run_dir = tmp_path / "opt" / "proofs" / "test" / "run_20250601_000000"
+    screenshots = run_dir / "screenshots"
+    screenshots.mkdir(parents=True)
+    for name in (shot("click", "start", 110), shot("click", "end", 111)):
+        (run_dir / name).write_bytes(b"\x89PNG\r\n\x1a\n truncated")
+    (run_dir / "network_logs.json").write_text(json.dumps(APP_REQUEST) + "\n")
+    log_path = tmp_path / "log.json"
+    log_path.write_text(json.dumps({"user_proxy_agent": [
+        {"name": "planner_agent", "content": {"plan": "1. Click the 'Login' button."}},
+    ]}))
+    monkeypatch.chdir(tmp_path)
+
+    report = triage_run("test", "run_20250601_000000", str(log_path))
+
+    assert report["verdict"] == "suspicious_run"
+    assert len(report["screenshots_to_analyze"]) == 2
@@ -0,0 +1,289 @@
+from agent_lc.tools import Tools
+from pathlib import Path
+from urllib.parse import urlparse
+from PIL import Image, ImageChops
+import logging
+import json
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Weights for each local signal; a run scoring at or above SUSPICIOUS_RUN_SCORE
+# is sent through the full vision and cross-check analysis
+SUSPICIOUS_RUN_SCORE = 1.0
+WEIGHTS = {
+    "no_plan": 1.0,
+    "missing_evidence": 0.5,
+    "unchanged_screenshot_pair": 0.3,
+    "unfinished_action": 0.3,
+    "unreadable_screenshot": 0.5,
+    "console_error": 0.4,
+    "http_client_error": 0.4,
+    "http_server_error": 0.6,
+}
+# Start/end screenshots count as unchanged when fewer than PIXEL_CHANGE_THRESHOLD
+# of their pixels differ by at least PIXEL_DIFFERENCE_THRESHOLD grayscale levels
+PIXEL_COMPARE_SIZE = (512, 288)
+PIXEL_DIFFERENCE_THRESHOLD = 16
+PIXEL_CHANGE_THRESHOLD = 0.0001
+# Seconds around an action during which an error is attributed to it
+ERROR_WINDOW_BEFORE = 1.0
+ERROR_WINDOW_AFTER = 2.0
+# Captured actions that do not correspond to a step of the plan
+UNPLANNED_ACTIONS = {"hover"}
+VERIFICATION_PREFIXES = ("verify", "check", "ensure")
+
+SCREENSHOT_PATTERN = re.compile(r"(\w+)_(start|end)_(\d+)\.png")
+
+def load_json_lines(path: Path) -> list:
+    """Load a file with one JSON object per line, skipping malformed lines"""
+    entries = []
+    if not path.exists():
+        return entries
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed line in {path}")
+    return entries
+
+def pair_screenshots(screenshot_files: list) -> list:
+    """Group start/end screenshots into actions ordered by time.
+
+    Each end screenshot is matched with the most recent unmatched start of
+    the same action type. Ends without a start (e.g. key presses) and starts
+    without an end are returned as actions with the missing side set to None.
+    """
+    shots = []
+    for path in screenshot_files:
+        match = SCREENSHOT_PATTERN.match(Path(path).name)
+        if match:
+            action_type, phase, timestamp = match.groups()
+            shots.append((int(timestamp), action_type, phase, path))
+    shots.sort()
+
+    actions = []
+    open_starts = {}
+    for timestamp, action_type, phase, path in shots:
+        if phase == "start":
+            if action_type in open_starts:
+                actions.append(open_starts.pop(action_type))
+            open_starts[action_type] = {
+                "action": action_type,
+                "start": path,
+                "end": None,
+                "start_time": timestamp / 1e9,
+                "end_time": None,
+            }
+        else:
+            action = open_starts.pop(action_type, None) or {
+                "action": action_type,
+                "start": None,
+                "start_time": None,
+            }
+            action["end"] = path
+            action["end_time"] = timestamp / 1e9
+            actions.append(action)
+    actions.extend(open_starts.values())
+    return sorted(actions, key=lambda a: a["start_time"] or a["end_time"])
+
+def changed_pixel_ratio(start_path: str, end_path: str) -> float:
+    """Fraction of pixels that visibly differ between two screenshots.
+
+    Both images are compared as grayscale at a fixed reduced size, which is
+    enough to catch small changes such as text typed into a field.
+    """
+    with Image.open(start_path) as start_img, Image.open(end_path) as end_img:
+        start_small = start_img.convert('L').resize(PIXEL_COMPARE_SIZE)
+        end_small = end_img.convert('L').resize(PIXEL_COMPARE_SIZE)
+    histogram = ImageChops.difference(start_small, end_small).histogram()
+    return sum(histogram[PIXEL_DIFFERENCE_THRESHOLD:]) / sum(histogram)
+
+def _base_domain(url: str) -> str:
+    host = urlparse(url).hostname or ""
+    return ".".join(host.split(".")[-2:])
+
+def collect_errors(console_logs: list, network_logs: list) -> list:
+    """Get console errors and HTTP error responses as (timestamp, url, kind, text) tuples"""
+    errors = []
+    for entry in console_logs:
+        if entry.get("level") == "error":
+            url = (entry.get("location") or {}).get("url", "")
+            errors.append((entry.get("timestamp"), url, "console_error", entry.get("text", "")))
+    for entry in network_logs:
+        status = entry.get("status")
+        if entry.get("type") == "response" and isinstance(status, int) and status >= 400:
+            kind = "http_server_error" if status >= 500 else "http_client_error"
+            errors.append((entry.get("timestamp"), entry.get("url", ""), kind, f"HTTP {status} {entry.get('url', '')}"))
+    return errors
+
+def is_planned_action(action: dict) -> bool:
+    """Whether a captured action stands for a plan step.
+
+    End-only captures (e.g. key presses recorded alongside text entry) and
+    hovers are incidental and do not count as evidence for a step.
+    """
+    return action["start"] is not None and action["action"] not in UNPLANNED_ACTIONS
+
+def score_run(plan_steps: list, actions: list, console_logs: list, network_logs: list) -> dict:
+    """Score a run from already collected local signals.
+
+    `actions` come from pair_screenshots, with a "changed" pixel ratio on
+    every action that has both screenshots, or "unreadable" set when they
+    could not be compared. A run is "clean" only when no
+    finding was recorded at all. Findings that can be tied to specific
+    screenshots route just those screenshots ("suspicious_steps"); missing
+    evidence, errors that no action explains, or a high overall score send
+    the whole run through full analysis ("suspicious_run"), as do
+    screenshots that could not be read. Unplanned actions such as hovers
+    are not expected to change the page. Errors from
+    third-party hosts are counted but never affect the verdict.
+    """
+    reasons = []
+    flagged = {}  # screenshot path -> reasons
+    score = 0.0
+    whole_run = False
+    third_party_errors = 0
+
+    def flag(action, reason):
+        for side in ("start", "end"):
+            if action[side]:
+                flagged.setdefault(action[side], []).append(reason)
+
+    if not plan_steps:
+        score += WEIGHTS["no_plan"]
+        whole_run = True
+        reasons.append("No plan steps could be extracted from the log")
+
+    for action in actions:
+        if action["start"] and not action["end"]:
+            score += WEIGHTS["unfinished_action"]
+            reasons.append(f"'{action['action']}' action started but has no end screenshot: {Path(action['start']).name}")
+            flag(action, "no end screenshot")
+        elif action.get("unreadable"):
+            score += WEIGHTS["unreadable_screenshot"]
+            whole_run = True
+            reasons.append(f"'{action['action']}' screenshots could not be compared: {Path(action['end']).name}")
+            flag(action, "unreadable screenshot")
+        elif (is_planned_action(action) and action.get("changed") is not None
+              and action["changed"] < PIXEL_CHANGE_THRESHOLD):
+            score += WEIGHTS["unchanged_screenshot_pair"]
+            reasons.append(f"'{action['action']}' action produced no visible change: {Path(action['end']).name}")
+            flag(action, "no visible change")
+
+    # Every plan step that is not a verification should leave screenshot evidence
+    action_steps = [s for s in plan_steps if not s["description"].lower().startswith(VERIFICATION_PREFIXES)]
+    planned_actions = [a for a in actions if is_planned_action(a)]
+    missing = len(action_steps) - len(planned_actions)
+    if missing > 0:
+        score += WEIGHTS["missing_evidence"] * missing
+        whole_run = True
+        reasons.append(f"{len(action_steps)} interaction steps planned but only {len(planned_actions)} captured")
+
+    # Console errors and HTTP error statuses
+    first_request = next((e for e in network_logs if e.get("type") == "request"), None)
+    app_domain = _base_domain(first_request["url"]) if first_request else ""
+    for timestamp, url, kind, text in collect_errors(console_logs, network_logs):
+        # Errors without a source URL are attributed to the app under test
+        if url and app_domain and _base_domain(url) != app_domain:
+            third_party_errors += 1
+            continue
+        score += WEIGHTS[kind]
+        label = kind.replace('_', ' ')
+        attributed = False
+        if timestamp is not None:
+            for action in actions:
+                action_start = action["start_time"] or action["end_time"]
+                action_end = action["end_time"] or action["start_time"]
+                if action_start - ERROR_WINDOW_BEFORE <= timestamp <= action_end + ERROR_WINDOW_AFTER:
+                    flag(action, label)
+                    attributed = True
+        if not attributed:
+            whole_run = True
+            label += " (not attributable to any screenshot)"
+        reasons.append(f"{label.capitalize()}: {text[:200]}")
+
+    if whole_run or score >= SUSPICIOUS_RUN_SCORE:
+        verdict = "suspicious_run"
+    elif reasons:
+        verdict = "suspicious_steps"
+    else:
+        verdict = "clean"
+
+    return {
+        "verdict": verdict,
+        "score": round(score, 2),
+        "reasons": reasons,
+        "plan_steps": len(plan_steps),
+        "captured_actions": len(planned_actions),
+        "ignored_third_party_errors": third_party_errors,
+        "flagged": flagged,
+    }
+
+def triage_run(test_name: str, run_id: str, log_path: str) -> dict:
+    """Score a test run from local signals only and decide how much of it needs model analysis.
+
+    Returns a report with the verdict ("clean", "suspicious_steps" or
+    "suspicious_run"), the score, the reasons behind it and the screenshots
+    that should be sent to the vision model.
+    """
+    started = time.perf_counter()
+    proofs_dir = Path("opt/proofs") / test_name / run_id
+
+    # Plan steps from the log
+    try:
+        plan_steps = Tools.parse_plan_steps(log_path)
+    except Exception as e:
+        logger.error(f"Error parsing plan steps: {str(e)}")
+        plan_steps = []
+
+    # Start/end screenshot pairs and pixel-change ratios
+    screenshot_files = [str(p) for p in sorted((proofs_dir / "screenshots").glob("*.png"))
+                        if SCREENSHOT_PATTERN.match(p.name)]
+    actions = pair_screenshots(screenshot_files)
+    for action in actions:
+        if action["start"] and action["end"]:
+            try:
+                action["changed"] = changed_pixel_ratio(action["start"], action["end"])
+            except Exception as e:
+                logger.error(f"Error comparing screenshots: {str(e)}")
+                action["unreadable"] = True
+
+    report = score_run(
+        plan_steps,
+        actions,
+        load_json_lines(proofs_dir / "console_logs.json"),
+        load_json_lines(proofs_dir / "network_logs.json"),
+    )
+    flagged = report.pop("flagged")
+    if report["verdict"] == "suspicious_run":
+        report["screenshots_to_analyze"] = screenshot_files
+    else:
+        report["screenshots_to_analyze"] = sorted(flagged)
+    report["flagged_screenshots"] = {Path(p).name: r for p, r in sorted(flagged.items())}
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+def format_triage_report(report: dict) -> str:
+    """Human-readable explanation of a triage report"""
+    lines = [
+        f"TRIAGE RESULT: {report['verdict']} (score {report['score']}, threshold {SUSPICIOUS_RUN_SCORE})",
+        f"- Plan steps: {report['plan_steps']}, captured actions: {report['captured_actions']}",
+    ]
+    if report["ignored_third_party_errors"]:
+        lines.append(f"- Ignored {report['ignored_third_party_errors']} third-party console/HTTP errors")
+    if report["reasons"]:
+        lines.append("- Findings:")
+        lines.extend(f"  * {reason}" for reason in report["reasons"])
+    else:
+        lines.append("- No console errors, HTTP errors, missing evidence or unchanged screenshots found locally")
+    if report["verdict"] == "clean":
+        lines.append("- Run marked verified without vision or cross-check analysis")
+    elif report["verdict"] == "suspicious_steps":
+        lines.append(f"- Only {len(report['screenshots_to_analyze'])} flagged screenshots routed to the vision model")
+    return "\n".join(lines)